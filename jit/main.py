@@ -5,8 +5,32 @@ import hashlib
 import time
 import json
 import sys
+import io
+import random
+import shutil
+import tempfile
+import platform
+import contextlib
+import functools
+import mmap
+import re
+import fnmatch
+import struct
+import zlib
+import codecs
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from colorama import init, Fore, Style
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 init(autoreset=True)
 
 JIT_DIR = '.jit'
@@ -16,6 +40,61 @@ HEAD_FILE = f'{JIT_DIR}/HEAD'
 INDEX_FILE = f'{JIT_DIR}/index'
 CONFIG_FILE = f'{JIT_DIR}/config'
 LOGS_DIR = f'{JIT_DIR}/logs'
+REF_JOURNAL = f'{JIT_DIR}/refs-journal'
+PACKED_REFS_FILE = f'{JIT_DIR}/packed-refs'
+COMMIT_GRAPH_FILE = f'{JIT_DIR}/commit-graph'
+SPARSE_FILE = f'{JIT_DIR}/sparse-checkout'
+STASH_FILE = f'{JIT_DIR}/stash'
+PATH_INDEX_DIR = f'{JIT_DIR}/path-index'
+COMMIT_IDS_DIR = f'{PATH_INDEX_DIR}/commits'
+NULL_HASH = '0' * 40
+
+# Object IDs are '<algorithm>-<hex>', except SHA-1 which stays bare hex so existing repos keep working
+DEFAULT_HASH_ALGORITHM = 'sha1'
+HASH_ALGORITHMS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'blake2b': lambda: hashlib.blake2b(digest_size=32),
+    'blake3': lambda: blake3.blake3()
+}
+HASH_CONFIG = {}
+CHUNK_CONFIG = {}
+
+# Kept under .jit so the trace never shows up as an untracked file
+TRACE_FILE = f'{JIT_DIR}/trace.json'
+
+# Files at or above chunk_threshold (see `jit config`) are split with FastCDC-style
+# content-defined chunking so that edits only produce new chunks around the change
+CHUNK_THRESHOLD = 8 * 1024 * 1024
+CHUNK_MIN = 256 * 1024
+CHUNK_AVG = 1024 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+CHUNK_SCAN_BLOCK = 256 * 1024
+CHUNK_MASK_S = ((1 << 22) - 1) << 42
+CHUNK_MASK_L = ((1 << 18) - 1) << 46
+GREP_OVERLAP = 64 * 1024
+GREP_POOL_MIN = 32
+
+# The commit graph is a header and then one fixed-width (parent, skip, generation) record per
+# commit, numbered in the order they were indexed; parents always come before their children
+GRAPH_MAGIC = b'JITGRAPH1\n'
+GRAPH_RECORD = struct.Struct('>III')
+GRAPH_NO_PARENT = 0xFFFFFFFF
+
+BUNDLE_MAGIC = b'JITBUNDLE1\n'
+BUNDLE_BATCH = 256
+
+GEAR = [int.from_bytes(hashlib.sha1(bytes([i])).digest()[:8], 'big') for i in range(256)]
+GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint64) if numpy is not None else None
+
+# JIT_TRACE=1 (or a file path) and --profile turn tracing on; everything below is a no-op otherwise
+TRACE = {
+    'enabled': bool(os.environ.get('JIT_TRACE')),
+    'output': os.environ.get('JIT_TRACE') if os.environ.get('JIT_TRACE') not in (None, '', '1') else TRACE_FILE,
+    'origin': time.perf_counter(),
+    'events': [],
+    'stats': {}
+}
 
 DEFAULT_IGNORE_PATTERNS = [
     '.jit/',
@@ -44,7 +123,115 @@ def highlight(msg):
 def bold(msg):
     return f"{Style.BRIGHT}{msg}{Style.RESET_ALL}"
 
-def init_jit():
+def record_trace(phase, start, nbytes=0):
+    end = time.perf_counter()
+    stats = TRACE['stats'].setdefault(phase, {'count': 0, 'bytes': 0, 'seconds': 0.0})
+    stats['count'] += 1
+    stats['bytes'] += nbytes
+    stats['seconds'] += end - start
+    TRACE['events'].append({
+        'name': phase,
+        'cat': 'jit',
+        'ph': 'X',
+        'ts': (start - TRACE['origin']) * 1e6,
+        'dur': (end - start) * 1e6,
+        'pid': os.getpid(),
+        'tid': 0,
+        'args': {'bytes': nbytes}
+    })
+
+def traced(phase, measure=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACE['enabled']:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            record_trace(phase, start, measure(args, result) if measure else 0)
+            return result
+        return wrapper
+    return decorator
+
+def file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+def walk_worktree(top='.'):
+    walker = os.walk(top)
+    while True:
+        if TRACE['enabled']:
+            start = time.perf_counter()
+            entry = next(walker, None)
+            record_trace('walk', start)
+        else:
+            entry = next(walker, None)
+        if entry is None:
+            return
+        yield entry
+
+def write_trace_report():
+    stats = TRACE['stats']
+    total = stats.get('command', {}).get('seconds', 0.0)
+
+    print(bold(f"\n{'phase':<16} {'count':>8} {'bytes':>14} {'ms':>10} {'share':>7}"), file=sys.stderr)
+    for phase, phase_stats in sorted(stats.items(), key=lambda x: -x[1]['seconds']):
+        share = phase_stats['seconds'] / total if total else 0.0
+        print(f"{phase:<16} {phase_stats['count']:>8} {phase_stats['bytes']:>14} "
+              f"{phase_stats['seconds'] * 1000:>10.2f} {share:>7.1%}", file=sys.stderr)
+
+    output = TRACE['output']
+    if output == TRACE_FILE and not os.path.isdir(JIT_DIR):
+        # Outside a repository there is no .jit to keep it in
+        output = os.path.basename(TRACE_FILE)
+    with open(output, 'w') as f:
+        f.write(json.dumps({'traceEvents': TRACE['events'], 'displayTimeUnit': 'ms'}))
+    print(f"Trace written to {highlight(output)} (open in chrome://tracing or Perfetto)", file=sys.stderr)
+
+def hash_algorithm_available(algorithm):
+    if algorithm not in HASH_ALGORITHMS:
+        return False
+    return algorithm != 'blake3' or blake3 is not None
+
+def get_hash_algorithm():
+    config_path = os.path.abspath(CONFIG_FILE)
+    if config_path not in HASH_CONFIG:
+        HASH_CONFIG[config_path] = read_config().get('hash_algorithm', DEFAULT_HASH_ALGORITHM)
+    return HASH_CONFIG[config_path]
+
+def id_algorithm(obj_id):
+    algorithm, _, _ = obj_id.rpartition('-')
+    return algorithm or 'sha1'
+
+def new_hasher(algorithm=None):
+    algorithm = algorithm or get_hash_algorithm()
+    if not hash_algorithm_available(algorithm):
+        print(error(f"Error: Hash algorithm '{algorithm}' is not available (blake3 needs 'pip install blake3')"))
+        sys.exit(1)
+    return HASH_ALGORITHMS[algorithm]()
+
+def format_id(hasher, algorithm=None):
+    algorithm = algorithm or get_hash_algorithm()
+    digest = hasher.hexdigest()
+    return digest if algorithm == 'sha1' else f"{algorithm}-{digest}"
+
+def hash_bytes(content, algorithm=None):
+    algorithm = algorithm or get_hash_algorithm()
+    hasher = new_hasher(algorithm)
+    hasher.update(content)
+    return format_id(hasher, algorithm)
+
+def short_id(obj_id):
+    return obj_id.rpartition('-')[2][:7] if obj_id else ''
+
+def init_jit(hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    if not hash_algorithm_available(hash_algorithm):
+        print(f"Error: Unknown or unavailable hash algorithm '{hash_algorithm}'")
+        print(f"Available: {', '.join(a for a in HASH_ALGORITHMS if hash_algorithm_available(a))}")
+        return False
+
     os.makedirs(OBJECTS_DIR, exist_ok=True)
     os.makedirs(REFS_DIR, exist_ok=True)
     os.makedirs(LOGS_DIR, exist_ok=True)
@@ -56,16 +243,23 @@ def init_jit():
         f.write(json.dumps({}))
 
     with open(CONFIG_FILE, 'w') as f:
-        f.write('')
+        f.write(json.dumps({'hash_algorithm': hash_algorithm}))
+    HASH_CONFIG.pop(os.path.abspath(CONFIG_FILE), None)
+    CHUNK_CONFIG.pop(os.path.abspath(CONFIG_FILE), None)
     
     with open(f'{REFS_DIR}/main', 'w') as f:
         f.write('')
     
+    os.makedirs(COMMIT_IDS_DIR, exist_ok=True)
+    with open(COMMIT_GRAPH_FILE, 'wb') as f:
+        f.write(GRAPH_MAGIC)
+    
     # Create default .gitignore file - add a flag for this to ignore this command
     create_gitignore()
     
-    print("Initialized empty Jit repository")
+    print(f"Initialized empty Jit repository ({hash_algorithm} object IDs)")
     print("Repository ready for your first commit")
+    return True
 
 def create_gitignore():
     if os.path.exists('.gitignore'):
@@ -75,6 +269,7 @@ def create_gitignore():
         for pattern in DEFAULT_IGNORE_PATTERNS:
             f.write(f"{pattern}\n")
 
+@traced('hash', lambda args, result: file_size(args[0]))
 def hash_file(file_path):
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -86,13 +281,15 @@ def hash_file(file_path):
             data = data.hex() 
             is_binary = True
             
-    file_hash = hashlib.sha1(data.encode() if not is_binary else bytes.fromhex(data)).hexdigest()
+    file_hash = hash_bytes(data.encode() if not is_binary else bytes.fromhex(data))
     
     return file_hash, data, is_binary
 
+@traced('object store', lambda args, result: len(args[0]) // 2 if args[1:] and args[1] else len(args[0]))
 def store_object(data, is_binary=False):
-    content = data if not is_binary else data.encode('utf-8')
-    obj_hash = hashlib.sha1(content if is_binary else content.encode()).hexdigest()
+    # Binary blobs are kept as raw bytes under the same hash hash_file() gives them, so they can be copied straight back out
+    content = data if not is_binary else bytes.fromhex(data)
+    obj_hash = hash_bytes(content if is_binary else content.encode())
     
     obj_path = os.path.join(OBJECTS_DIR, obj_hash)
     if not os.path.exists(obj_path):
@@ -101,6 +298,164 @@ def store_object(data, is_binary=False):
     
     return obj_hash
 
+@traced('hash', lambda args, result: file_size(args[0]))
+def hash_file_stream(file_path):
+    hasher = new_hasher()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_AVG), b''):
+            hasher.update(block)
+    return format_id(hasher)
+
+@traced('object store', lambda args, result: len(args[0]))
+def store_raw_object(content):
+    obj_hash = hash_bytes(content)
+
+    obj_path = os.path.join(OBJECTS_DIR, obj_hash)
+    if not os.path.exists(obj_path):
+        with open(obj_path, 'wb') as f:
+            f.write(content)
+
+    return obj_hash
+
+def gear_window_hashes(data):
+    # h[i] is the gear hash of the 64 bytes ending at i; doubling the window each pass
+    # (h_2w[i] = h_w[i] + (h_w[i - w] << w)) takes 6 vector passes instead of a loop per byte
+    hashes = GEAR_ARRAY[numpy.frombuffer(data, dtype=numpy.uint8)]
+    width = 1
+    while width < 64:
+        hashes[width:] += hashes[:-width] << numpy.uint64(width)
+        width *= 2
+    return hashes
+
+def find_chunk_boundary(data, start, end):
+    if end - start <= CHUNK_MIN:
+        return end
+
+    normal = min(start + CHUNK_AVG, end)
+    limit = min(start + CHUNK_MAX, end)
+    # The hash only covers the last 64 bytes, so warming up 64 bytes before CHUNK_MIN gives the same cut points either way
+    warmup = start + CHUNK_MIN - 64
+
+    # Stricter mask before the average size and a looser one after it keeps chunk sizes close to CHUNK_AVG
+    if GEAR_ARRAY is not None:
+        # Scan in blocks so a cut near CHUNK_MIN does not pay for hashing all the way to CHUNK_MAX
+        for block_start in range(start + CHUNK_MIN, limit, CHUNK_SCAN_BLOCK):
+            block_end = min(block_start + CHUNK_SCAN_BLOCK, limit)
+            hashes = gear_window_hashes(data[block_start - 64:block_end])[64:]
+            if block_start < normal:
+                strict = numpy.flatnonzero((hashes[:normal - block_start] & numpy.uint64(CHUNK_MASK_S)) == 0)
+                if strict.size:
+                    return block_start + int(strict[0]) + 1
+            loose_from = max(normal - block_start, 0)
+            loose = numpy.flatnonzero((hashes[loose_from:] & numpy.uint64(CHUNK_MASK_L)) == 0)
+            if loose.size:
+                return block_start + loose_from + int(loose[0]) + 1
+        return limit
+
+    gear = GEAR
+    h = 0
+    for byte in data[warmup:start + CHUNK_MIN]:
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFFFFFFFFFF
+    for i, byte in enumerate(data[start + CHUNK_MIN:normal], start + CHUNK_MIN):
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFFFFFFFFFF
+        if not h & CHUNK_MASK_S:
+            return i + 1
+    for i, byte in enumerate(data[normal:limit], normal):
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFFFFFFFFFF
+        if not h & CHUNK_MASK_L:
+            return i + 1
+    return limit
+
+@traced('chunk', lambda args, result: file_size(args[0]))
+def store_chunked_file(file_path):
+    hasher = new_hasher()
+    chunks = []
+    size = 0
+    buffer = b''
+    view = memoryview(buffer)
+    pos = 0
+
+    with open(file_path, 'rb') as f:
+        eof = False
+        while not eof or pos < len(buffer):
+            # Refill only when less than one max-size chunk is left; cuts just move pos through a zero-copy view
+            if not eof and len(buffer) - pos < CHUNK_MAX:
+                block = f.read(CHUNK_MAX * 4)
+                eof = not block
+                buffer = buffer[pos:] + block
+                view = memoryview(buffer)
+                pos = 0
+                continue
+
+            cut = find_chunk_boundary(view, pos, len(buffer))
+            chunk = view[pos:cut]
+            pos = cut
+
+            hasher.update(chunk)
+            chunks.append([store_raw_object(chunk), len(chunk)])
+            size += len(chunk)
+
+    manifest = {
+        'type': 'chunked',
+        'size': size,
+        'chunks': chunks
+    }
+    manifest_hash = store_object(json.dumps(manifest))
+
+    return format_id(hasher), manifest_hash
+
+def read_config():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_config(config):
+    with open(CONFIG_FILE, 'w') as f:
+        f.write(json.dumps(config, indent=2))
+    CHUNK_CONFIG.pop(os.path.abspath(CONFIG_FILE), None)
+
+def get_chunk_threshold():
+    # Staging asks once per file, so only read the config the first time
+    config_path = os.path.abspath(CONFIG_FILE)
+    if config_path not in CHUNK_CONFIG:
+        CHUNK_CONFIG[config_path] = read_config().get('chunk_threshold', CHUNK_THRESHOLD)
+    return CHUNK_CONFIG[config_path]
+
+def content_hash(file_path, file_info):
+    if file_info.get('chunked', False):
+        return hash_file_stream(file_path)
+    file_hash, _, _ = hash_file(file_path)
+    return file_hash
+
+def set_config(key, value=None):
+    config = read_config()
+    
+    if key == 'hash_algorithm' and value is not None:
+        print("Error: The hash algorithm is chosen once with 'jit init --hash <algorithm>'")
+        return False
+
+    if value is None:
+        if key not in config:
+            print(f"Error: '{key}' is not set")
+            return False
+        print(config[key])
+        return True
+
+    try:
+        config[key] = json.loads(value)
+    except json.JSONDecodeError:
+        config[key] = value
+
+    if key == 'chunk_threshold' and (type(config[key]) is not int or config[key] < 0):
+        print(f"Error: chunk_threshold must be a non-negative number of bytes, got '{value}'")
+        return False
+    write_config(config)
+    print(f"Set {key} = {config[key]}")
+    return True
+
+@traced('index read', lambda args, result: file_size(INDEX_FILE))
 def read_index():
     try:
         with open(INDEX_FILE, 'r') as f:
@@ -108,10 +463,209 @@ def read_index():
     except (FileNotFoundError, json.JSONDecodeError):
         return {}
 
+@traced('index write', lambda args, result: file_size(INDEX_FILE))
 def write_index(index):
     with open(INDEX_FILE, 'w') as f:
         f.write(json.dumps(index))
 
+@traced('ref update')
+def write_ref(branch_name, commit_hash):
+    with open(f"{REFS_DIR}/{branch_name}", 'w') as f:
+        f.write(commit_hash)
+
+@traced('ref journal')
+def write_ref_journal(journal):
+    tmp_path = f"{REF_JOURNAL}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(journal))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, REF_JOURNAL)
+
+    # Make the rename itself durable; not every platform lets us open a directory
+    try:
+        dir_fd = os.open(JIT_DIR, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def reflog_path(branch_name):
+    return f"{LOGS_DIR}/refs/heads/{branch_name}"
+
+def append_reflogs(journal, skip_logged=False):
+    # One record per line, so only the subject of a multi-line message is logged
+    subject = (journal['message'].splitlines() or [''])[0]
+    records = {}
+    for branch_name, old_hash, new_hash in journal['updates']:
+        record = f"{old_hash or NULL_HASH} {new_hash or NULL_HASH} {journal['timestamp']}\t{subject}\n"
+        records.setdefault(branch_name, []).append(record)
+
+    for branch_name, lines in records.items():
+        log_path = reflog_path(branch_name)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+        if skip_logged and os.path.exists(log_path):
+            with open(log_path, 'r') as f:
+                logged = f.readlines()
+            if logged[-len(lines):] == lines:
+                continue
+
+        with open(log_path, 'a') as f:
+            f.write(''.join(lines))
+
+def apply_ref_journal(journal, skip_logged=False):
+    for branch_name, _, new_hash in journal['updates']:
+        write_ref(branch_name, new_hash)
+    append_reflogs(journal, skip_logged)
+    os.remove(REF_JOURNAL)
+
+def recover_ref_journal():
+    if not os.path.exists(REF_JOURNAL):
+        return
+
+    try:
+        with open(REF_JOURNAL, 'r') as f:
+            journal = json.loads(f.read())
+    except json.JSONDecodeError:
+        # The journal is only renamed into place once fully written, so a torn file was never committed
+        os.remove(REF_JOURNAL)
+        return
+
+    apply_ref_journal(journal, skip_logged=True)
+
+def read_ref(branch_name):
+    branch_path = f"{REFS_DIR}/{branch_name}"
+    if os.path.exists(branch_path):
+        with open(branch_path, 'r') as f:
+            return f.read().strip()
+    return lookup_packed_ref(branch_name)
+
+def read_packed_refs():
+    refs = {}
+    if not os.path.exists(PACKED_REFS_FILE):
+        return refs
+
+    with open(PACKED_REFS_FILE, 'r') as f:
+        for line in f:
+            commit_hash, _, branch_name = line.rstrip('\n').partition(' ')
+            refs[branch_name] = '' if commit_hash == NULL_HASH else commit_hash
+    return refs
+
+def lookup_packed_ref(branch_name):
+    if file_size(PACKED_REFS_FILE) == 0:
+        return None
+
+    target = branch_name.encode('utf-8')
+    with open(PACKED_REFS_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as packed:
+        # Lines are sorted by name, so bisect over byte offsets and snap to the enclosing line
+        lo, hi = 0, len(packed)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = packed.rfind(b'\n', 0, mid) + 1
+            end = packed.find(b'\n', start)
+            if end == -1:
+                end = len(packed)
+
+            commit_hash, _, name = packed[start:end].partition(b' ')
+            if name == target:
+                commit_hash = commit_hash.decode('utf-8')
+                return '' if commit_hash == NULL_HASH else commit_hash
+            if name < target:
+                lo = end + 1
+            else:
+                hi = start
+    return None
+
+def list_refs():
+    refs = read_packed_refs()
+    if os.path.exists(REFS_DIR):
+        for branch_name in os.listdir(REFS_DIR):
+            branch_path = f"{REFS_DIR}/{branch_name}"
+            if os.path.isfile(branch_path):
+                with open(branch_path, 'r') as f:
+                    refs[branch_name] = f.read().strip()
+    return dict(sorted(refs.items()))
+
+def pack_refs():
+    refs = list_refs()
+    if not refs:
+        print(info("No refs to pack"))
+        return True
+
+    lines = []
+    for branch_name in sorted(refs, key=lambda name: name.encode('utf-8')):
+        lines.append(f"{refs[branch_name] or NULL_HASH} {branch_name}\n")
+
+    tmp_path = f"{PACKED_REFS_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(''.join(lines))
+    os.replace(tmp_path, PACKED_REFS_FILE)
+
+    loose = [branch_name for branch_name in os.listdir(REFS_DIR) if os.path.isfile(f"{REFS_DIR}/{branch_name}")]
+    for branch_name in loose:
+        os.remove(f"{REFS_DIR}/{branch_name}")
+
+    print(f"Packed {len(refs)} ref(s) into {PACKED_REFS_FILE}")
+    return True
+
+def update_refs(updates, message):
+    # One fsync'd journal write makes the whole batch durable; the ref files and
+    # reflogs are then written without syncing and replayed from the journal after a crash
+    journal = {
+        'message': message,
+        'timestamp': time.time(),
+        'updates': [[branch_name, read_ref(branch_name) or '', new_hash] for branch_name, new_hash in updates.items()]
+    }
+    write_ref_journal(journal)
+    apply_ref_journal(journal)
+
+def read_reflog(branch_name):
+    log_path = reflog_path(branch_name)
+    if not os.path.exists(log_path):
+        return []
+
+    entries = []
+    with open(log_path, 'r') as f:
+        for line in f:
+            header, _, message = line.rstrip('\n').partition('\t')
+            fields = header.split(' ')
+            if len(fields) != 3:
+                # Continuation of a multi-line message written before records were kept to one line
+                continue
+            old_hash, new_hash, timestamp = fields
+            entries.append({
+                'old': old_hash,
+                'new': new_hash,
+                'timestamp': float(timestamp),
+                'message': message
+            })
+    return entries
+
+def show_reflog(branch_name=None):
+    if not branch_name:
+        branch_name, _ = get_current_branch_and_commit()
+        if not branch_name:
+            print(error("Error: Cannot show reflog in detached HEAD state"))
+            return False
+
+    entries = read_reflog(branch_name)
+    if not entries:
+        print(info(f"No reflog entries for '{branch_name}'"))
+        return True
+
+    for i, entry in enumerate(reversed(entries)):
+        date = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['timestamp']))
+        print(f"{highlight(short_id(entry['new']))} {branch_name}@{{{i}}}: {Style.DIM}{date}{Style.RESET_ALL} {entry['message']}")
+    return True
+
+@traced('ref update')
+def write_head(branch_name):
+    with open(HEAD_FILE, 'w') as f:
+        f.write(f"ref: refs/heads/{branch_name}")
+
 def get_current_branch_and_commit():
     if not os.path.exists(HEAD_FILE):
         return None, None
@@ -123,12 +677,7 @@ def get_current_branch_and_commit():
         ref_path = head_content[5:]  
         branch_name = ref_path.split('/')[-1]
         
-        branch_file = f"{JIT_DIR}/{ref_path}"
-        if os.path.exists(branch_file):
-            with open(branch_file, 'r') as f:
-                commit_hash = f.read().strip()
-        else:
-            commit_hash = ""
+        commit_hash = read_ref(branch_name) or ""
     else:
         branch_name = None
         commit_hash = head_content
@@ -171,9 +720,94 @@ def should_ignore_file(file_path):
     
     return False
 
+def read_sparse_patterns():
+    if not os.path.exists(SPARSE_FILE):
+        return []
+    with open(SPARSE_FILE, 'r') as f:
+        return [os.path.normpath(line.strip()) for line in f if line.strip() and not line.startswith('#')]
+
+def write_sparse_patterns(patterns):
+    if not patterns:
+        if os.path.exists(SPARSE_FILE):
+            os.remove(SPARSE_FILE)
+        return
+    with open(SPARSE_FILE, 'w') as f:
+        for pattern in patterns:
+            f.write(f"{pattern}\n")
+
+def has_glob(pattern):
+    return any(char in pattern for char in '*?[')
+
+def is_sparse_included(file_path, patterns):
+    if not patterns:
+        return True
+    
+    for pattern in patterns:
+        if has_glob(pattern) and fnmatch.fnmatchcase(file_path, pattern):
+            return True
+        if file_path == pattern or file_path.startswith(pattern + os.sep):
+            return True
+    return False
+
+def sparse_dir_may_match(dir_path, patterns):
+    if not patterns:
+        return True
+    
+    for pattern in patterns:
+        # Globs can match anywhere, so only plain directory patterns let us skip a subtree
+        if has_glob(pattern):
+            return True
+        if pattern == dir_path or pattern.startswith(dir_path + os.sep) or dir_path.startswith(pattern + os.sep):
+            return True
+    return False
+
+def stage_entry(file_path):
+    # Stat before reading so that a write racing with the hash leaves a mismatch behind
+    stat = os.stat(file_path)
+    
+    if stat.st_size >= get_chunk_threshold():
+        file_hash, manifest_hash = store_chunked_file(file_path)
+        entry = {
+            'hash': file_hash,
+            'timestamp': time.time(),
+            'binary': True,
+            'chunked': True,
+            'manifest': manifest_hash
+        }
+    else:
+        file_hash, data, is_binary = hash_file(file_path)
+        store_object(data, is_binary)
+        entry = {
+            'hash': file_hash,
+            'timestamp': time.time(),
+            'binary': is_binary
+        }
+    
+    entry['size'] = stat.st_size
+    entry['mtime'] = stat.st_mtime_ns
+    return entry
+
+def stat_unchanged(file_path, file_info):
+    if 'mtime' not in file_info:
+        return False
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    
+    # A file written in the same second it was staged may change again without moving a coarse mtime, so always hash those
+    if file_info['mtime'] // 1000000000 >= int(file_info['timestamp']):
+        return False
+    return stat.st_size == file_info['size'] and stat.st_mtime_ns == file_info['mtime']
+
 def add_file(file_path):
     file_path = os.path.normpath(file_path)
     
+    # A path outside the sparse checkout is missing on purpose, not deleted
+    if not is_sparse_included(file_path, read_sparse_patterns()):
+        print(f"Error: '{file_path}' is outside the sparse checkout")
+        return
+    
     if not os.path.exists(file_path):
         tracked_files = get_tracked_files()
         if file_path in tracked_files:
@@ -192,16 +826,10 @@ def add_file(file_path):
         print(f"Ignoring '{file_path}' (matches ignore pattern)")
         return
     
-    file_hash, data, is_binary = hash_file(file_path)
-    
-    store_object(data, is_binary)
+    entry = stage_entry(file_path)
     
     index = read_index()
-    index[file_path] = {
-        'hash': file_hash,
-        'timestamp': time.time(),
-        'binary': is_binary
-    }
+    index[file_path] = entry
     write_index(index)
     
     tracked_files = get_tracked_files()
@@ -230,6 +858,10 @@ def add_all_changes():
 def remove_file(file_path, force=False):
     file_path = os.path.normpath(file_path)
     
+    if not is_sparse_included(file_path, read_sparse_patterns()):
+        print(f"Error: '{file_path}' is outside the sparse checkout")
+        return False
+    
     tracked_files = get_tracked_files()
     is_tracked = file_path in tracked_files
     
@@ -282,16 +914,16 @@ def commit_changes(message):
     
     commit_json = json.dumps(commit_data)
     commit_hash = store_object(commit_json)
+    index_commit(commit_hash, commit_data)
     
-    with open(f'{REFS_DIR}/{branch_name}', 'w') as f:
-        f.write(commit_hash)
+    update_refs({branch_name: commit_hash}, f"commit: {message}")
     
     write_index({})
     
     added = sum(1 for info in tree.values() if not info.get('deleted', False))
     deleted = sum(1 for info in tree.values() if info.get('deleted', False))
     
-    print(f"[{commit_hash[:7]}] {message}")
+    print(f"[{short_id(commit_hash)}] {message}")
     print(f" {added} file(s) changed, {deleted} deletion(s)")
     
     return commit_hash
@@ -320,30 +952,36 @@ def get_status():
             if file_info['hash'] != tracked_files[file_path]['hash']:
                 status['staged_modified'].append(file_path)
     
-    for root, dirs, files in os.walk('.'):
+    sparse_patterns = read_sparse_patterns()
+    
+    for root, dirs, files in walk_worktree('.'):
         if JIT_DIR in dirs:
             dirs.remove(JIT_DIR) 
+        if sparse_patterns:
+            dirs[:] = [d for d in dirs if sparse_dir_may_match(os.path.normpath(os.path.join(root, d)), sparse_patterns)]
         
         for file in files:
             file_path = os.path.normpath(os.path.join(root, file))
             
-            if should_ignore_file(file_path):
+            if should_ignore_file(file_path) or not is_sparse_included(file_path, sparse_patterns):
                 continue
                 
             if file_path in index:
-                if not index[file_path].get('deleted', False):
-                    file_hash, _, _ = hash_file(file_path)
+                if not index[file_path].get('deleted', False) and not stat_unchanged(file_path, index[file_path]):
+                    file_hash = content_hash(file_path, index[file_path])
                     if file_hash != index[file_path]['hash']:
                         status['modified'].append(file_path)
             elif file_path in tracked_files:
-                file_hash, _, _ = hash_file(file_path)
+                if stat_unchanged(file_path, tracked_files[file_path]):
+                    continue
+                file_hash = content_hash(file_path, tracked_files[file_path])
                 if file_hash != tracked_files[file_path]['hash']:
                     status['modified'].append(file_path)
             else:
                 status['untracked'].append(file_path)
     
     for file_path in tracked_files:
-        if file_path not in index and not os.path.exists(file_path):
+        if file_path not in index and is_sparse_included(file_path, sparse_patterns) and not os.path.exists(file_path):
             status['deleted'].append(file_path)
     
     return status
@@ -354,7 +992,7 @@ def show_status():
     if branch_name:
         print(f"On branch {Fore.GREEN}{branch_name}{Style.RESET_ALL}")
     else:
-        print(f"HEAD detached at {highlight(commit_hash[:7])}")
+        print(f"HEAD detached at {highlight(short_id(commit_hash))}")
     
     status = get_status()
     
@@ -382,6 +1020,41 @@ def show_status():
     if not any(status.values()):
         print(f"\n{success('Working tree clean')}")
 
+def print_commit(commit_hash, commit_data, paths=None):
+    print(f"{Fore.YELLOW}Commit: {highlight(commit_hash)}")
+    print(f"Date:    {Style.DIM}{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(commit_data['timestamp']))}{Style.RESET_ALL}")
+    print(f"Message: {bold(commit_data['message'])}")
+    
+    added_files = []
+    modified_files = []
+    deleted_files = []
+    for file_path, file_info in commit_data['tree'].items():
+        if paths is not None and not any(file_path == path or file_path.startswith(path + os.sep) for path in paths):
+            continue
+        if file_info.get('deleted', False):
+            deleted_files.append(file_path)
+        elif commit_data.get('parent'):
+            modified_files.append(file_path)
+        else:
+            added_files.append(file_path)
+    
+    if added_files:
+        print(f"{Fore.GREEN}Added files (+):{Style.RESET_ALL}")
+        for file in added_files:
+            print(f"  {Fore.GREEN}{file}{Style.RESET_ALL}")
+    
+    if modified_files:
+        print(f"{Fore.YELLOW}Modified files (~):{Style.RESET_ALL}")
+        for file in modified_files:
+            print(f"  {Fore.YELLOW}{file}{Style.RESET_ALL}")
+    
+    if deleted_files:
+        print(f"{Fore.RED}Deleted files (-):{Style.RESET_ALL}")
+        for file in deleted_files:
+            print(f"  {Fore.RED}{file}{Style.RESET_ALL}")
+    
+    print()
+
 def show_log():
     _, current_commit = get_current_branch_and_commit()
     
@@ -402,53 +1075,227 @@ def show_log():
         with open(commit_path, 'r') as f:
             commit_data = json.loads(f.read())
         
-        print(f"{Fore.YELLOW}Commit: {highlight(commit_hash)}")
-        print(f"Date:    {Style.DIM}{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(commit_data['timestamp']))}{Style.RESET_ALL}")
-        print(f"Message: {bold(commit_data['message'])}")
-        
-        added_files = []
-        modified_files = []
-        deleted_files = []
-        for file_path, file_info in commit_data['tree'].items():
-            if file_info.get('deleted', False):
-                deleted_files.append(file_path)
-            elif commit_data.get('parent'):
-                modified_files.append(file_path)
-            else:
-                added_files.append(file_path)
-        
-        if added_files:
-            print(f"{Fore.GREEN}Added files (+):{Style.RESET_ALL}")
-            for file in added_files:
-                print(f"  {Fore.GREEN}{file}{Style.RESET_ALL}")
-        
-        if modified_files:
-            print(f"{Fore.YELLOW}Modified files (~):{Style.RESET_ALL}")
-            for file in modified_files:
-                print(f"  {Fore.YELLOW}{file}{Style.RESET_ALL}")
-        
-        if deleted_files:
-            print(f"{Fore.RED}Deleted files (-):{Style.RESET_ALL}")
-            for file in deleted_files:
-                print(f"  {Fore.RED}{file}{Style.RESET_ALL}")
-        
-        print()
+        print_commit(commit_hash, commit_data)
         commit_hash = commit_data.get('parent')
         visited.add(commit_hash)
 
+def path_index_bucket(file_path):
+    return f"{PATH_INDEX_DIR}/{hashlib.sha1(file_path.encode('utf-8')).hexdigest()[:2]}"
+
+def commit_id_bucket(commit_hash):
+    return f"{COMMIT_IDS_DIR}/{commit_hash[-2:]}"
+
+def path_index_keys(tree):
+    # Every directory above a changed path is indexed too, so `jit log -- <dir>` is a single lookup
+    keys = set()
+    for file_path in tree:
+        while file_path and file_path not in keys:
+            keys.add(file_path)
+            file_path = os.path.dirname(file_path)
+    return keys
+
+def graph_skip_generation(generation):
+    # Skew-binary skip pointers, so any ancestor is at most O(log n) hops away
+    if generation < 2:
+        return 0
+    if generation & 1:
+        generation = (generation - 1) & (generation - 2)
+        return (generation & (generation - 1)) + 1
+    return generation & (generation - 1)
+
+def graph_ancestor(read_record, record, generation):
+    parent, skip, walk_generation = read_record(record)
+    while walk_generation > generation:
+        skip_generation = graph_skip_generation(walk_generation)
+        skip_prev = graph_skip_generation(walk_generation - 1)
+        if skip_generation == generation or (skip_generation > generation and not (skip_prev < skip_generation - 2 and skip_prev >= generation)):
+            record, walk_generation = skip, skip_generation
+        else:
+            record, walk_generation = parent, walk_generation - 1
+        parent, skip, _ = read_record(record)
+    return record
+
+def graph_entry(read_record, parent_record):
+    if parent_record is None:
+        return (GRAPH_NO_PARENT, GRAPH_NO_PARENT, 0)
+    generation = read_record(parent_record)[2] + 1
+    return (parent_record, graph_ancestor(read_record, parent_record, graph_skip_generation(generation)), generation)
+
+def commit_graph_ready():
+    # Repos from before the binary graph (or before any index) wait for `jit reindex`
+    try:
+        with open(COMMIT_GRAPH_FILE, 'rb') as f:
+            return f.read(len(GRAPH_MAGIC)) == GRAPH_MAGIC
+    except FileNotFoundError:
+        return False
+
+def lookup_graph_record(commit_hash):
+    bucket_path = commit_id_bucket(commit_hash)
+    if not os.path.exists(bucket_path):
+        return None
+    record = None
+    with open(bucket_path, 'r') as f:
+        for line in f:
+            indexed_hash, _, indexed_record = line.rstrip('\n').partition(' ')
+            if indexed_hash == commit_hash:
+                record = int(indexed_record)
+    return record
+
+def append_commit_record(commit_hash, commit_data):
+    parent_hash = commit_data.get('parent')
+    parent_record = lookup_graph_record(parent_hash) if parent_hash else None
+
+    with open(COMMIT_GRAPH_FILE, 'r+b') as f:
+        def read_record(record):
+            f.seek(len(GRAPH_MAGIC) + record * GRAPH_RECORD.size)
+            return GRAPH_RECORD.unpack(f.read(GRAPH_RECORD.size))
+
+        entry = graph_entry(read_record, parent_record)
+        end = f.seek(0, os.SEEK_END)
+        record = (end - len(GRAPH_MAGIC)) // GRAPH_RECORD.size
+        f.write(GRAPH_RECORD.pack(*entry))
+
+    os.makedirs(COMMIT_IDS_DIR, exist_ok=True)
+    with open(commit_id_bucket(commit_hash), 'a') as f:
+        f.write(f"{commit_hash} {record}\n")
+
+    buckets = {}
+    for key in path_index_keys(commit_data.get('tree', {})):
+        buckets.setdefault(path_index_bucket(key), []).append(f"{key}\t{commit_hash}\t{record}\n")
+    for bucket_path, lines in buckets.items():
+        with open(bucket_path, 'a') as f:
+            f.write(''.join(lines))
+
+@traced('path index')
+def index_commit(commit_hash, commit_data):
+    # Appending to an index that is missing or in the old format would leave it looking
+    # complete while missing history, so wait for `jit reindex` instead
+    if not commit_graph_ready():
+        return
+
+    # Parents need their record first; unbundled history can arrive child first
+    pending = []
+    while commit_hash and lookup_graph_record(commit_hash) is None:
+        pending.append((commit_hash, commit_data))
+        commit_hash = commit_data.get('parent')
+        commit_path = f"{OBJECTS_DIR}/{commit_hash}"
+        if not commit_hash or not os.path.exists(commit_path):
+            break
+        with open(commit_path, 'r') as f:
+            commit_data = json.loads(f.read())
+
+    for commit_hash, commit_data in reversed(pending):
+        append_commit_record(commit_hash, commit_data)
+
+def rebuild_path_index():
+    refs = list_refs()
+    tmp_graph = f"{COMMIT_GRAPH_FILE}.tmp"
+    tmp_dir = f"{PATH_INDEX_DIR}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, os.path.basename(COMMIT_IDS_DIR)))
+
+    records = {}
+    entries = []
+    buckets = {}
+    id_buckets = {}
+    for tip_commit in refs.values():
+        chain = []
+        commit_hash = tip_commit
+        while commit_hash and commit_hash not in records:
+            commit_path = f"{OBJECTS_DIR}/{commit_hash}"
+            if not os.path.exists(commit_path):
+                break
+            with open(commit_path, 'r') as f:
+                commit_data = json.loads(f.read())
+            chain.append((commit_hash, commit_data.get('parent'), list(commit_data.get('tree', {}))))
+            commit_hash = commit_data.get('parent')
+
+        # Oldest first, so every parent already has a record
+        for commit_hash, parent_hash, tree in reversed(chain):
+            record = len(entries)
+            entries.append(graph_entry(entries.__getitem__, records.get(parent_hash)))
+            records[commit_hash] = record
+            id_buckets.setdefault(commit_hash[-2:], []).append(f"{commit_hash} {record}\n")
+            for key in path_index_keys(tree):
+                bucket = os.path.basename(path_index_bucket(key))
+                buckets.setdefault(bucket, []).append(f"{key}\t{commit_hash}\t{record}\n")
+
+    for bucket, lines in buckets.items():
+        with open(os.path.join(tmp_dir, bucket), 'w') as f:
+            f.write(''.join(lines))
+    for bucket, lines in id_buckets.items():
+        with open(os.path.join(tmp_dir, os.path.basename(COMMIT_IDS_DIR), bucket), 'w') as f:
+            f.write(''.join(lines))
+    with open(tmp_graph, 'wb') as f:
+        f.write(GRAPH_MAGIC + b''.join(GRAPH_RECORD.pack(*entry) for entry in entries))
+
+    shutil.rmtree(PATH_INDEX_DIR, ignore_errors=True)
+    os.replace(tmp_dir, PATH_INDEX_DIR)
+    os.replace(tmp_graph, COMMIT_GRAPH_FILE)
+
+    print(f"Indexed {len(entries)} commit(s) touching {sum(len(lines) for lines in buckets.values())} path(s)")
+    return True
+
+def show_path_log(file_path):
+    file_path = os.path.normpath(file_path)
+    if file_path == '.':
+        show_log()
+        return
+
+    _, current_commit = get_current_branch_and_commit()
+    if not current_commit:
+        print(info("No commits yet"))
+        return
+    
+    head_record = lookup_graph_record(current_commit) if commit_graph_ready() else None
+    if head_record is None:
+        print(info("Building path history index..."))
+        rebuild_path_index()
+        head_record = lookup_graph_record(current_commit)
+    
+    candidates = {}
+    bucket_path = path_index_bucket(file_path)
+    if os.path.exists(bucket_path):
+        with open(bucket_path, 'r') as f:
+            for line in f:
+                key, commit_hash, record = line.rstrip('\n').split('\t')
+                if key == file_path:
+                    candidates[int(record)] = commit_hash
+    
+    if not candidates:
+        print(info(f"No commits touch '{file_path}'"))
+        return
+    
+    # A candidate is on this branch if it is HEAD's ancestor at its own generation; the skip
+    # pointers answer that in a few seeks, without reading the rest of the graph
+    matches = []
+    with open(COMMIT_GRAPH_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as graph:
+        def read_record(record):
+            return GRAPH_RECORD.unpack_from(graph, len(GRAPH_MAGIC) + record * GRAPH_RECORD.size)
+
+        head_generation = read_record(head_record)[2]
+        for record, commit_hash in candidates.items():
+            generation = read_record(record)[2]
+            if generation <= head_generation and graph_ancestor(read_record, head_record, generation) == record:
+                matches.append((generation, commit_hash))
+    
+    if not matches:
+        print(info(f"No commits on this branch touch '{file_path}'"))
+        return
+    
+    print(bold(f"History of {file_path}:"))
+    for _, commit_hash in sorted(matches, reverse=True):
+        with open(f"{OBJECTS_DIR}/{commit_hash}", 'r') as f:
+            commit_data = json.loads(f.read())
+        print_commit(commit_hash, commit_data, paths={file_path})
+
 def show_all_logs():
-    if not os.path.exists(REFS_DIR):
+    refs = list_refs()
+    if not refs:
         print("No branches found")
         return
     
-    branches = {}
-    for branch in os.listdir(REFS_DIR):
-        branch_path = f"{REFS_DIR}/{branch}"
-        if os.path.isfile(branch_path):
-            with open(branch_path, 'r') as f:
-                commit_hash = f.read().strip()
-                if commit_hash:
-                    branches[branch] = commit_hash
+    branches = {branch: commit_hash for branch, commit_hash in refs.items() if commit_hash}
     
     if not branches:
         print("No commits found in any branch")
@@ -464,6 +1311,13 @@ def show_all_logs():
         visited = set()
         
         while commit_hash and commit_hash not in visited:
+            # Another branch already walked everything below here
+            if commit_hash in all_commits:
+                if commit_hash == tip_commit:
+                    all_commits[commit_hash]['branches'].append(branch_name)
+                    branch_tips[branch_name] = commit_hash
+                break
+            
             commit_path = f"{OBJECTS_DIR}/{commit_hash}"
             if not os.path.exists(commit_path):
                 break
@@ -473,11 +1327,10 @@ def show_all_logs():
             with open(commit_path, 'r') as f:
                 commit_data = json.loads(f.read())
             
-            if commit_hash not in all_commits:
-                all_commits[commit_hash] = {
-                    'data': commit_data,
-                    'branches': []
-                }
+            all_commits[commit_hash] = {
+                'data': commit_data,
+                'branches': []
+            }
             
             if commit_hash == tip_commit:
                 all_commits[commit_hash]['branches'].append(branch_name)
@@ -530,28 +1383,26 @@ def show_all_logs():
     print("* - current branch")
 
 def create_branch(branch_name):
-    if os.path.exists(f"{REFS_DIR}/{branch_name}"):
-        print(f"Error: Branch '{branch_name}' already exists")
-        return False
+    return create_branches([branch_name])
+
+def create_branches(branch_names):
+    for branch_name in branch_names:
+        if read_ref(branch_name) is not None:
+            print(f"Error: Branch '{branch_name}' already exists")
+            return False
     
     _, current_commit = get_current_branch_and_commit()
     
-    with open(f"{REFS_DIR}/{branch_name}", 'w') as f:
-        f.write(current_commit if current_commit else '')
+    start = short_id(current_commit) if current_commit else 'HEAD'
+    update_refs({branch_name: current_commit if current_commit else '' for branch_name in branch_names},
+                f"branch: Created from {start}")
     
-    print(f"Created branch '{branch_name}' at {current_commit[:7] if current_commit else 'HEAD'}")
+    for branch_name in branch_names:
+        print(f"Created branch '{branch_name}' at {start}")
     return True
 
 def list_branches():
-    if not os.path.exists(REFS_DIR):
-        print(error("No branches found"))
-        return
-    
-    branches = []
-    for branch in os.listdir(REFS_DIR):
-        branch_path = f"{REFS_DIR}/{branch}"
-        if os.path.isfile(branch_path):
-            branches.append(branch)
+    branches = list_refs()
     
     if not branches:
         print(info("No branches found"))
@@ -560,48 +1411,98 @@ def list_branches():
     current_branch, _ = get_current_branch_and_commit()
     
     print(bold("Branches:"))
-    for branch in branches:
-        with open(f"{REFS_DIR}/{branch}", 'r') as f:
-            commit = f.read().strip()
-        
+    for branch, commit in branches.items():
         if branch == current_branch:
-            print(f"{Fore.GREEN}* {branch}{Style.RESET_ALL} (current) - {commit[:7] if commit else ''}")
+            print(f"{Fore.GREEN}* {branch}{Style.RESET_ALL} (current) - {short_id(commit)}")
         else:
-            print(f"  {Fore.CYAN}{branch}{Style.RESET_ALL} - {commit[:7] if commit else ''}")
+            print(f"  {Fore.CYAN}{branch}{Style.RESET_ALL} - {short_id(commit)}")
+
+def copy_object_into(obj_path, out):
+    out.flush()
+    with open(obj_path, 'rb') as src:
+        remaining = os.fstat(src.fileno()).st_size
+        try:
+            # Let the kernel move the bytes (or share extents on CoW filesystems) instead of going through Python
+            if hasattr(os, 'copy_file_range'):
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), out.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            elif hasattr(os, 'sendfile'):
+                offset = 0
+                while remaining > 0:
+                    copied = os.sendfile(out.fileno(), src.fileno(), offset, remaining)
+                    if copied == 0:
+                        break
+                    offset += copied
+                    remaining -= copied
+                src.seek(offset)
+        except OSError:
+            # Cross-device or unsupported filesystem - finish the rest with a buffered copy
+            src.seek(os.fstat(src.fileno()).st_size - remaining)
+            out.seek(0, os.SEEK_END)
+        if remaining > 0:
+            shutil.copyfileobj(src, out)
+
+def restore_chunked_file(file_path, file_info):
+    manifest_path = f"{OBJECTS_DIR}/{file_info['manifest']}"
+    if not os.path.exists(manifest_path):
+        print(f"Error: Object {file_info['manifest']} not found")
+        return
+
+    with open(manifest_path, 'r') as f:
+        manifest = json.loads(f.read())
+
+    missing = [chunk_hash for chunk_hash, _ in manifest['chunks'] if not os.path.exists(f"{OBJECTS_DIR}/{chunk_hash}")]
+    if missing:
+        print(f"Error: Object {missing[0]} not found")
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+
+    with open(file_path, 'wb') as out:
+        for chunk_hash, _ in manifest['chunks']:
+            copy_object_into(f"{OBJECTS_DIR}/{chunk_hash}", out)
 
+@traced('checkout write', lambda args, result: file_size(args[0]))
 def restore_file_from_commit(file_path, file_info):
     if file_info.get('deleted', False):
         if os.path.exists(file_path):
             os.remove(file_path)
         return
     
+    if file_info.get('chunked', False):
+        restore_chunked_file(file_path, file_info)
+        return
+    
     obj_path = f"{OBJECTS_DIR}/{file_info['hash']}"
     if not os.path.exists(obj_path):
         print(f"Error: Object {file_info['hash']} not found")
         return
     
-    with open(obj_path, 'r', encoding='utf-8') as f:
-        data = f.read()
-    
     os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
     
+    # Text objects are stored with '\n' line endings, so they only need decoding where the platform translates newlines
     is_binary = file_info.get('binary', False)
-    if is_binary:
-        with open(file_path, 'wb') as f:
-            f.write(bytes.fromhex(data))
+    if is_binary or os.linesep == '\n':
+        with open(file_path, 'wb') as out:
+            copy_object_into(obj_path, out)
     else:
+        with open(obj_path, 'r', encoding='utf-8') as f:
+            data = f.read()
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(data)
 
 def checkout_branch(branch_name, create=False):
     if create:
-        if os.path.exists(f"{REFS_DIR}/{branch_name}"):
+        if read_ref(branch_name) is not None:
             print(f"Error: Branch '{branch_name}' already exists")
             return False
         create_branch(branch_name)
     
-    branch_path = f"{REFS_DIR}/{branch_name}"
-    if not os.path.exists(branch_path):
+    commit_hash = read_ref(branch_name)
+    if commit_hash is None:
         print(f"Error: Branch '{branch_name}' does not exist")
         return False
     
@@ -615,11 +1516,7 @@ def checkout_branch(branch_name, create=False):
         print(f"Already on branch '{branch_name}'")
         return True
     
-    with open(branch_path, 'r') as f:
-        commit_hash = f.read().strip()
-    
-    with open(HEAD_FILE, 'w') as f:
-        f.write(f"ref: refs/heads/{branch_name}")
+    write_head(branch_name)
     
     if not commit_hash:
         print(f"Switched to branch '{branch_name}' (empty branch)")
@@ -648,8 +1545,10 @@ def checkout_branch(branch_name, create=False):
             except Exception as e:
                 print(f"Warning: Could not remove {file_path}: {e}")
     
+    sparse_patterns = read_sparse_patterns()
     for file_path, file_info in tree.items():
-        restore_file_from_commit(file_path, file_info)
+        if is_sparse_included(file_path, sparse_patterns):
+            restore_file_from_commit(file_path, file_info)
     
     print(f"Switched to branch '{branch_name}'")
     return True
@@ -679,14 +1578,532 @@ def restore_commit(commit_hash):
             except Exception as e:
                 print(f"Warning: Could not remove {file_path}: {e}")
     
+    sparse_patterns = read_sparse_patterns()
     for file_path, file_info in tree.items():
+        if not is_sparse_included(file_path, sparse_patterns):
+            continue
         restore_file_from_commit(file_path, file_info)
         if file_info.get('deleted', False):
             print(f"Deleted {file_path}")
         else:
             print(f"Restored {file_path}")
     
-    print(f"Working directory restored to commit {commit_hash[:7]}")
+    print(f"Working directory restored to commit {short_id(commit_hash)}")
+    return True
+
+def commit_snapshot(commit_hash):
+    # Commit trees only hold what changed, so the full snapshot is the newest entry for each path down the parent chain
+    snapshot = {}
+    visited = set()
+    while commit_hash and commit_hash not in visited:
+        visited.add(commit_hash)
+        commit_path = f"{OBJECTS_DIR}/{commit_hash}"
+        if not os.path.exists(commit_path):
+            break
+        with open(commit_path, 'r') as f:
+            commit_data = json.loads(f.read())
+        for file_path, file_info in commit_data.get('tree', {}).items():
+            snapshot.setdefault(file_path, file_info)
+        commit_hash = commit_data.get('parent')
+
+    return {file_path: file_info for file_path, file_info in snapshot.items() if not file_info.get('deleted', False)}
+
+def grep_binary(paths, regex):
+    # Undecodable bytes become lone surrogates, so the same str regex works on binary data; keep
+    # some overlap between chunks so a match straddling two of them is still found
+    tail = b''
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = tail + f.read()
+        if regex.search(data.decode('utf-8', 'surrogateescape')):
+            return True
+        tail = data[-GREP_OVERLAP:]
+    return False
+
+def grep_blob(paths, regex):
+    # Chunks are decoded as one stream so big text files still report matching lines
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    matches = []
+    line_no = 0
+    pending = ''
+    try:
+        for i, path in enumerate(paths):
+            last = i == len(paths) - 1
+            with open(path, 'rb') as f:
+                lines = (pending + decoder.decode(f.read(), final=last)).splitlines(True)
+            pending = lines.pop() if lines and not last and not lines[-1].endswith('\n') else ''
+            for line in lines:
+                line_no += 1
+                line = line.splitlines()[0]
+                if regex.search(line):
+                    matches.append((line_no, line))
+    except UnicodeDecodeError:
+        return bool(matches) or grep_binary(paths, regex)
+    return matches
+
+def blob_paths(file_info):
+    if not file_info.get('chunked', False):
+        return [f"{OBJECTS_DIR}/{file_info['hash']}"]
+    with open(f"{OBJECTS_DIR}/{file_info['manifest']}", 'r') as f:
+        manifest = json.loads(f.read())
+    return [f"{OBJECTS_DIR}/{chunk_hash}" for chunk_hash, _ in manifest['chunks']]
+
+def print_grep_result(result, file_paths, prefix):
+    found = 0
+    for file_path in sorted(file_paths):
+        if result is True:
+            print(f"Binary file {prefix}{file_path} matches")
+            found += 1
+        elif result:
+            for line_no, line in result:
+                print(f"{highlight(prefix + file_path)}:{success(str(line_no))}:{line}")
+            found += 1
+    return found
+
+def grep(pattern, commit_hash=None, ignore_case=False):
+    try:
+        regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    except re.error as e:
+        print(error(f"Error: Invalid pattern '{pattern}': {e}"))
+        return False
+
+    # Group paths by blob so every distinct content is scanned once
+    blobs = {}
+    if commit_hash:
+        commit_path = f"{OBJECTS_DIR}/{commit_hash}"
+        if not os.path.exists(commit_path):
+            print(f"Error: Commit {commit_hash} not found")
+            return False
+        for file_path, file_info in commit_snapshot(commit_hash).items():
+            key = file_info.get('manifest') or file_info['hash']
+            if key not in blobs:
+                try:
+                    blobs[key] = (blob_paths(file_info), [])
+                except FileNotFoundError:
+                    print(f"Error: Object {key} not found")
+                    continue
+            blobs[key][1].append(file_path)
+        prefix = f"{short_id(commit_hash)}:"
+    else:
+        # Clean files share their staged or committed blob; only dirty files are read from disk
+        index = read_index()
+        _, head_commit = get_current_branch_and_commit()
+        tracked_files = commit_snapshot(head_commit)
+        for root, dirs, files in walk_worktree('.'):
+            if JIT_DIR in dirs:
+                dirs.remove(JIT_DIR)
+            for file in files:
+                file_path = os.path.normpath(os.path.join(root, file))
+                if should_ignore_file(file_path):
+                    continue
+                file_info = index.get(file_path) or tracked_files.get(file_path)
+                if file_info and not file_info.get('deleted', False) and stat_unchanged(file_path, file_info):
+                    key = file_info.get('manifest') or file_info['hash']
+                    if key not in blobs:
+                        try:
+                            blobs[key] = (blob_paths(file_info), [])
+                        except FileNotFoundError:
+                            key = file_path
+                            blobs[key] = ([file_path], [])
+                    blobs[key][1].append(file_path)
+                else:
+                    blobs[file_path] = ([file_path], [file_path])
+        prefix = ''
+
+    found = 0
+    if len(blobs) < GREP_POOL_MIN:
+        for paths, file_paths in blobs.values():
+            found += print_grep_result(grep_blob(paths, regex), file_paths, prefix)
+    else:
+        with ProcessPoolExecutor() as pool:
+            futures = {pool.submit(grep_blob, paths, regex): file_paths for paths, file_paths in blobs.values()}
+            for future in as_completed(futures):
+                found += print_grep_result(future.result(), futures[future], prefix)
+
+    return found > 0
+
+def apply_sparse_checkout(patterns):
+    if read_index():
+        print("Error: You have uncommitted changes. Commit or stash them before changing the sparse checkout.")
+        return False
+    
+    old_patterns = read_sparse_patterns()
+    write_sparse_patterns(patterns)
+    
+    # HEAD's tree only holds its own changes, so walk the full snapshot
+    _, commit_hash = get_current_branch_and_commit()
+    added = 0
+    removed = 0
+    for file_path, file_info in commit_snapshot(commit_hash).items():
+        was_included = is_sparse_included(file_path, old_patterns)
+        now_included = is_sparse_included(file_path, patterns)
+        
+        if now_included and not was_included:
+            restore_file_from_commit(file_path, file_info)
+            added += 1
+        elif was_included and not now_included and os.path.exists(file_path):
+            if content_hash(file_path, file_info) != file_info['hash']:
+                print(warning(f"Warning: Keeping modified file {file_path}"))
+                continue
+            os.remove(file_path)
+            try:
+                os.removedirs(os.path.dirname(file_path))
+            except OSError:
+                pass
+            removed += 1
+    
+    print(f"Sparse checkout updated: {added} file(s) materialized, {removed} file(s) removed")
+    return True
+
+def sparse_checkout(args):
+    if not args or args[0] == "list":
+        patterns = read_sparse_patterns()
+        if not patterns:
+            print(info("Sparse checkout is disabled"))
+        for pattern in patterns:
+            print(pattern)
+        return True
+    
+    subcommand = args[0]
+    patterns = [os.path.normpath(pattern) for pattern in args[1:]]
+    
+    if subcommand == "set":
+        if not patterns:
+            print("Error: At least one pattern is required")
+            return False
+        return apply_sparse_checkout(patterns)
+    elif subcommand == "add":
+        if not patterns:
+            print("Error: At least one pattern is required")
+            return False
+        current = read_sparse_patterns()
+        return apply_sparse_checkout(current + [pattern for pattern in patterns if pattern not in current])
+    elif subcommand == "disable":
+        return apply_sparse_checkout([])
+    
+    print(f"Error: Unknown sparse-checkout command '{subcommand}'")
+    return False
+
+def read_stash_list():
+    if not os.path.exists(STASH_FILE):
+        return []
+    with open(STASH_FILE, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def write_stash_list(stashes):
+    with open(STASH_FILE, 'w') as f:
+        f.write(''.join(f"{stash_hash}\n" for stash_hash in stashes))
+
+def worktree_changes(tracked_files, index):
+    # Compare against the full snapshot so files last committed before HEAD are not mistaken for untracked ones
+    sparse_patterns = read_sparse_patterns()
+    modified = []
+    deleted = []
+    for file_path in sorted(set(tracked_files) | set(index)):
+        if not is_sparse_included(file_path, sparse_patterns):
+            continue
+        file_info = index.get(file_path) or tracked_files[file_path]
+        if file_info.get('deleted', False):
+            continue
+        if not os.path.exists(file_path):
+            deleted.append(file_path)
+        elif not stat_unchanged(file_path, file_info) and content_hash(file_path, file_info) != file_info['hash']:
+            modified.append(file_path)
+    return modified, deleted
+
+def stash_push(message=None):
+    branch_name, commit_hash = get_current_branch_and_commit()
+    index = read_index()
+    tracked_files = commit_snapshot(commit_hash)
+    modified, deleted = worktree_changes(tracked_files, index)
+    
+    if not index and not modified and not deleted:
+        print("No local changes to save")
+        return False
+    
+    # Blobs that are already staged or committed are only referenced; just the unstaged edits get hashed and stored
+    worktree = {}
+    for file_path in modified:
+        worktree[file_path] = stage_entry(file_path)
+    for file_path in deleted:
+        worktree[file_path] = {
+            'deleted': True,
+            'timestamp': time.time()
+        }
+    
+    if not message:
+        message = f"WIP on {branch_name or 'HEAD'}: {short_id(commit_hash) if commit_hash else 'no commits'}"
+    
+    stash_data = {
+        'type': 'stash',
+        'message': message,
+        'branch': branch_name,
+        'base': commit_hash or None,
+        'timestamp': time.time(),
+        'index': index,
+        'worktree': worktree
+    }
+    stash_hash = store_object(json.dumps(stash_data))
+    write_stash_list(read_stash_list() + [stash_hash])
+    
+    # HEAD's tree only holds its own changes, so reset against the full snapshot
+    for file_path in set(index) | set(worktree):
+        if file_path in tracked_files:
+            restore_file_from_commit(file_path, tracked_files[file_path])
+        elif os.path.exists(file_path):
+            os.remove(file_path)
+    write_index({})
+    
+    print(f"Saved working directory and index state: {message}")
+    return True
+
+def path_matches_head(file_path, tracked_files):
+    if file_path not in tracked_files:
+        return not os.path.exists(file_path)
+    if not os.path.exists(file_path):
+        return False
+    file_info = tracked_files[file_path]
+    return stat_unchanged(file_path, file_info) or content_hash(file_path, file_info) == file_info['hash']
+
+def stash_pop():
+    stashes = read_stash_list()
+    if not stashes:
+        print("No stash entries found")
+        return False
+    
+    if read_index():
+        print("Error: You have staged changes. Commit them before popping a stash.")
+        return False
+    
+    stash_hash = stashes[-1]
+    with open(f"{OBJECTS_DIR}/{stash_hash}", 'r') as f:
+        stash_data = json.loads(f.read())
+    
+    # Only the stashed paths are checked and rewritten, so popping costs as much as the stash, not the repo
+    _, commit_hash = get_current_branch_and_commit()
+    tracked_files = commit_snapshot(commit_hash)
+    paths = set(stash_data['index']) | set(stash_data['worktree'])
+    conflicts = sorted(file_path for file_path in paths if not path_matches_head(file_path, tracked_files))
+    if conflicts:
+        print("Error: Your local changes to the following files would be overwritten:")
+        for file_path in conflicts:
+            print(f"  {file_path}")
+        return False
+    
+    for file_path, file_info in stash_data['index'].items():
+        restore_file_from_commit(file_path, file_info)
+    for file_path, file_info in stash_data['worktree'].items():
+        restore_file_from_commit(file_path, file_info)
+    write_index(stash_data['index'])
+    
+    write_stash_list(stashes[:-1])
+    print(f"Dropped stash@{{0}} ({short_id(stash_hash)}): {stash_data['message']}")
+    return True
+
+def stash_list():
+    stashes = read_stash_list()
+    for i, stash_hash in enumerate(reversed(stashes)):
+        with open(f"{OBJECTS_DIR}/{stash_hash}", 'r') as f:
+            stash_data = json.loads(f.read())
+        print(f"{highlight(f'stash@{{{i}}}')}: On {stash_data['branch'] or 'HEAD'}: {stash_data['message']}")
+    return True
+
+def reachable_objects(tips, stop=None):
+    stop = stop or set()
+    commits = []
+    blobs = []
+    seen = set()
+
+    for tip in tips:
+        chain = []
+        commit_hash = tip
+        while commit_hash and commit_hash not in seen and commit_hash not in stop:
+            seen.add(commit_hash)
+            commit_path = f"{OBJECTS_DIR}/{commit_hash}"
+            if not os.path.exists(commit_path):
+                break
+            with open(commit_path, 'r') as f:
+                commit_data = json.loads(f.read())
+
+            chain.append(commit_hash)
+            for file_info in commit_data.get('tree', {}).values():
+                if file_info.get('deleted', False):
+                    continue
+                if file_info.get('chunked', False):
+                    blobs.append(file_info['manifest'])
+                    try:
+                        blobs.extend(obj_path.rsplit('/', 1)[-1] for obj_path in blob_paths(file_info))
+                    except FileNotFoundError:
+                        # Its chunks are unknown without the manifest; the manifest itself gets the usual warning
+                        pass
+                else:
+                    blobs.append(file_info['hash'])
+            commit_hash = commit_data.get('parent')
+
+        # Parents first, so an importer can index commits in the order they were made
+        commits.extend(reversed(chain))
+
+    return commits, list(dict.fromkeys(blobs))
+
+def bundle_create(bundle_path, branch_names=None, since=None):
+    refs = list_refs()
+    if branch_names:
+        missing = [branch_name for branch_name in branch_names if branch_name not in refs]
+        if missing:
+            print(f"Error: Branch '{missing[0]}' does not exist")
+            return False
+        refs = {branch_name: refs[branch_name] for branch_name in branch_names}
+    refs = {branch_name: commit_hash for branch_name, commit_hash in refs.items() if commit_hash}
+
+    if not refs:
+        print("Error: Nothing to bundle, no branch has commits")
+        return False
+
+    stop = set()
+    excluded_blobs = set()
+    if since:
+        if not os.path.exists(f"{OBJECTS_DIR}/{since}"):
+            print(f"Error: Commit {since} not found")
+            return False
+        stop, base_blobs = reachable_objects([since])
+        stop = set(stop)
+        excluded_blobs = set(base_blobs)
+
+    commits, blobs = reachable_objects(list(refs.values()), stop)
+    objects = [obj_hash for obj_hash in blobs if obj_hash not in excluded_blobs] + commits
+
+    entries = []
+    with open(bundle_path, 'wb') as out:
+        out.write(BUNDLE_MAGIC)
+        for obj_hash in objects:
+            obj_path = f"{OBJECTS_DIR}/{obj_hash}"
+            if not os.path.exists(obj_path):
+                print(warning(f"Warning: Object {obj_hash} not found, skipping"))
+                continue
+            with open(obj_path, 'rb') as f:
+                compressed = zlib.compress(f.read())
+            entries.append([obj_hash, out.tell(), len(compressed)])
+            out.write(compressed)
+
+        bundle_index = zlib.compress(json.dumps({
+            'hash_algorithm': get_hash_algorithm(),
+            'refs': refs,
+            'base': since,
+            'commits': commits,
+            'objects': entries
+        }).encode('utf-8'))
+        index_offset = out.tell()
+        out.write(bundle_index)
+        out.write(struct.pack('>QQ', index_offset, len(bundle_index)))
+
+    print(f"Created bundle {bundle_path} with {len(entries)} object(s) and {len(refs)} ref(s)")
+    return True
+
+def read_bundle_index(bundle_path):
+    with open(bundle_path, 'rb') as f:
+        if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            raise ValueError("not a jit bundle")
+        f.seek(-16, os.SEEK_END)
+        index_offset, index_length = struct.unpack('>QQ', f.read(16))
+        f.seek(index_offset)
+        return json.loads(zlib.decompress(f.read(index_length)).decode('utf-8'))
+
+def unbundle_batch(bundle_path, entries):
+    corrupt = []
+    with open(bundle_path, 'rb') as f:
+        for obj_hash, offset, length in entries:
+            f.seek(offset)
+            try:
+                content = zlib.decompress(f.read(length))
+            except zlib.error:
+                corrupt.append(obj_hash)
+                continue
+            if hash_bytes(content, id_algorithm(obj_hash)) != obj_hash:
+                corrupt.append(obj_hash)
+                continue
+
+            # Write then rename so a half-written object never shows up under its final name
+            obj_path = os.path.join(OBJECTS_DIR, obj_hash)
+            tmp_path = f"{obj_path}.tmp{os.getpid()}"
+            with open(tmp_path, 'wb') as obj:
+                obj.write(content)
+            os.replace(tmp_path, obj_path)
+    return corrupt
+
+def is_ancestor(ancestor, commit_hash):
+    visited = set()
+    while commit_hash and commit_hash not in visited:
+        if commit_hash == ancestor:
+            return True
+        visited.add(commit_hash)
+        commit_path = f"{OBJECTS_DIR}/{commit_hash}"
+        if not os.path.exists(commit_path):
+            return False
+        with open(commit_path, 'r') as f:
+            commit_hash = json.loads(f.read()).get('parent')
+    return False
+
+def bundle_unbundle(bundle_path):
+    try:
+        bundle_index = read_bundle_index(bundle_path)
+    except (OSError, ValueError, zlib.error, struct.error) as e:
+        print(f"Error: Could not read bundle {bundle_path}: {e}")
+        return False
+
+    # Bundles from before the algorithm was recorded can only have come from SHA-1 repos
+    algorithm = bundle_index.get('hash_algorithm', DEFAULT_HASH_ALGORITHM)
+    foreign = [entry[0] for entry in bundle_index['objects'] if id_algorithm(entry[0]) != get_hash_algorithm()]
+    if algorithm != get_hash_algorithm() or foreign:
+        print(f"Error: Bundle uses {algorithm} object IDs but this repository uses {get_hash_algorithm()}")
+        return False
+
+    base = bundle_index.get('base')
+    if base and not os.path.exists(f"{OBJECTS_DIR}/{base}"):
+        print(f"Error: Bundle requires commit {base} which is not in this repository")
+        return False
+
+    new_entries = [entry for entry in bundle_index['objects'] if not os.path.exists(f"{OBJECTS_DIR}/{entry[0]}")]
+    skipped = len(bundle_index['objects']) - len(new_entries)
+    new_commits = [commit_hash for commit_hash in bundle_index['commits'] if not os.path.exists(f"{OBJECTS_DIR}/{commit_hash}")]
+
+    batches = [new_entries[i:i + BUNDLE_BATCH] for i in range(0, len(new_entries), BUNDLE_BATCH)]
+    corrupt = []
+    if len(batches) <= 1:
+        for batch in batches:
+            corrupt.extend(unbundle_batch(bundle_path, batch))
+    else:
+        with ProcessPoolExecutor() as pool:
+            for result in pool.map(unbundle_batch, [bundle_path] * len(batches), batches):
+                corrupt.extend(result)
+
+    if corrupt:
+        print(error(f"Error: {len(corrupt)} object(s) failed verification, e.g. {corrupt[0]}"))
+        print("Refs were not updated")
+        return False
+
+    for commit_hash in new_commits:
+        with open(f"{OBJECTS_DIR}/{commit_hash}", 'r') as f:
+            index_commit(commit_hash, json.loads(f.read()))
+
+    current_branch, _ = get_current_branch_and_commit()
+    updates = {}
+    for branch_name, commit_hash in bundle_index['refs'].items():
+        old_hash = read_ref(branch_name)
+        if old_hash == commit_hash or (old_hash and is_ancestor(commit_hash, old_hash)):
+            continue
+        if old_hash and not is_ancestor(old_hash, commit_hash):
+            print(warning(f"Warning: Not updating '{branch_name}', {short_id(commit_hash)} is not a fast-forward of {short_id(old_hash)}"))
+            continue
+        updates[branch_name] = commit_hash
+
+    if updates:
+        update_refs(updates, f"unbundle: {os.path.basename(bundle_path)}")
+
+    print(f"Unbundled {len(new_entries)} object(s), {skipped} already present")
+    for branch_name, commit_hash in updates.items():
+        print(f"  {branch_name} -> {short_id(commit_hash)}")
+    if current_branch in updates:
+        print(info(f"'{current_branch}' is checked out; run 'jit restore {updates[current_branch]}' to update the working tree"))
     return True
 
 def clean_untracked_files(force=False):
@@ -715,8 +2132,8 @@ def clean_untracked_files(force=False):
             print(f"Error removing {file_path}: {e}")
 
 def rebase_branch(target_branch):
-    target_branch_path = f"{REFS_DIR}/{target_branch}"
-    if not os.path.exists(target_branch_path):
+    target_commit = read_ref(target_branch)
+    if target_commit is None:
         print(f"Error: Branch '{target_branch}' does not exist")
         return False
 
@@ -725,9 +2142,6 @@ def rebase_branch(target_branch):
         print("Error: Cannot rebase in detached HEAD state")
         return False
 
-    with open(target_branch_path, 'r') as f:
-        target_commit = f.read().strip()
-
     if current_commit == target_commit:
         print(f"Already up to date with '{target_branch}'")
         return True
@@ -754,15 +2168,313 @@ def rebase_branch(target_branch):
         commit_data['parent'] = new_parent
         commit_json = json.dumps(commit_data)
         new_commit_hash = store_object(commit_json)
+        index_commit(new_commit_hash, commit_data)
         new_parent = new_commit_hash
 
-    with open(f"{REFS_DIR}/{current_branch}", 'w') as f:
-        f.write(new_parent)
+    update_refs({current_branch: new_parent}, f"rebase: onto {target_branch}")
 
     print(f"Successfully rebased '{current_branch}' onto '{target_branch}'")
     return True
 
+BENCH_DEFAULTS = {
+    'files': 500,
+    'min_size': 64,
+    'max_size': 64 * 1024,
+    'binary_ratio': 0.1,
+    'depth': 3,
+    'fanout': 4,
+    'commits': 20,
+    'churn': 0.05,
+    'repeat': 3,
+    'seed': 42,
+    'threshold': 0.2,
+    'min_delta': 0.005,
+    'hash': DEFAULT_HASH_ALGORITHM,
+}
+
+BENCH_WORDS = [
+    'alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+    'india', 'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa',
+    'def', 'return', 'import', 'class', 'self', 'None', 'True', 'False'
+]
+
+def random_text(rng, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(rng.choice(BENCH_WORDS) for _ in range(rng.randint(3, 12)))
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)[:size]
+
+def random_binary(rng, size):
+    # A leading 0xff byte is never valid utf-8, so hash_file always takes the binary path
+    return b'\xff' + rng.getrandbits(8 * size).to_bytes(size, 'little')[1:]
+
+def write_synthetic_file(rng, file_path, params):
+    # Log-uniform sizes give the usual "many small files, few big ones" shape
+    low = max(1, params['min_size'])
+    high = max(low, params['max_size'])
+    size = int(round(low * (high / low) ** rng.random()))
+
+    if rng.random() < params['binary_ratio']:
+        with open(file_path, 'wb') as f:
+            f.write(random_binary(rng, size))
+    else:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(random_text(rng, size))
+
+def generate_synthetic_repo(path, params):
+    rng = random.Random(params['seed'])
+    file_paths = []
+
+    for i in range(params['files']):
+        parts = [f"d{rng.randrange(params['fanout'])}" for _ in range(rng.randint(0, params['depth']))]
+        directory = os.path.join(path, *parts)
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f"file{i}.dat")
+        write_synthetic_file(rng, file_path, params)
+        file_paths.append(os.path.relpath(file_path, path))
+
+    return rng, file_paths
+
+def churn_files(rng, file_paths, params):
+    count = max(1, int(len(file_paths) * params['churn']))
+    for file_path in rng.sample(file_paths, min(count, len(file_paths))):
+        write_synthetic_file(rng, file_path, params)
+
+def time_call(func, *args, repeat=1, setup=None):
+    # setup runs untimed before each repeat so commands that change the repo can be re-timed
+    best = None
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if setup:
+                setup(i)
+            start = time.perf_counter()
+            func(*args)
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def measure_hash_throughput(file_paths):
+    contents = []
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            contents.append(f.read())
+    total_bytes = sum(len(content) for content in contents)
+
+    throughput = {}
+    for algorithm in HASH_ALGORITHMS:
+        if not hash_algorithm_available(algorithm):
+            continue
+        start = time.perf_counter()
+        for content in contents:
+            hash_bytes(content, algorithm)
+        elapsed = time.perf_counter() - start
+        throughput[f"hash {algorithm}"] = total_bytes / elapsed / 1e9 if elapsed else 0.0
+    return throughput
+
+def run_benchmarks(params):
+    results = {}
+    throughput = {}
+    repo_dir = tempfile.mkdtemp(prefix='jit-bench-')
+    original_dir = os.getcwd()
+
+    try:
+        rng, file_paths = generate_synthetic_repo(repo_dir, params)
+        os.chdir(repo_dir)
+
+        throughput = measure_hash_throughput(file_paths)
+        total_bytes = sum(file_size(file_path) for file_path in file_paths)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_jit(params['hash'])
+
+        # Nothing is committed yet, so emptying the object store and index puts the repo back to just after init
+        def unstage_all(i):
+            shutil.rmtree(OBJECTS_DIR)
+            os.makedirs(OBJECTS_DIR)
+            write_index({})
+
+        results['add .'] = time_call(add_all_changes, repeat=params['repeat'], setup=unstage_all)
+        throughput['add .'] = total_bytes / results['add .'] / 1e9
+        with contextlib.redirect_stdout(io.StringIO()):
+            commit_changes('bench: initial commit')
+
+        # Fork the base branch half way so that checkout and rebase have real work to do
+        base_at = params['commits'] // 2
+        for i in range(1, params['commits']):
+            if i == base_at:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    create_branch('bench-base')
+            churn_files(rng, file_paths, params)
+            with contextlib.redirect_stdout(io.StringIO()):
+                add_all_changes()
+                commit_changes(f'bench: commit {i}')
+
+        if read_ref('bench-base') is None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                create_branch('bench-base')
+
+        churn_files(rng, file_paths, params)
+        results['status'] = time_call(get_status, repeat=params['repeat'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_all_changes()
+            commit_changes('bench: pending changes')
+
+        def stage_changes(i):
+            churn_files(rng, file_paths, params)
+            add_all_changes()
+
+        results['commit'] = time_call(commit_changes, 'bench: staged changes',
+                                      repeat=params['repeat'], setup=stage_changes)
+
+        results['log'] = time_call(show_log, repeat=params['repeat'])
+        results['log --all'] = time_call(show_all_logs, repeat=params['repeat'])
+
+        results['checkout'] = time_call(checkout_branch, 'bench-base', repeat=params['repeat'],
+                                        setup=lambda i: checkout_branch('main'))
+
+        # Rebase a fresh copy of main each time so every repeat replays the same commits
+        def fresh_branch(i):
+            checkout_branch('main')
+            checkout_branch(f'bench-rebase-{i}', create=True)
+
+        results['rebase'] = time_call(rebase_branch, 'bench-base', repeat=params['repeat'],
+                                      setup=fresh_branch)
+        with contextlib.redirect_stdout(io.StringIO()):
+            checkout_branch('main')
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(repo_dir, ignore_errors=True)
+
+    return {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+        'throughput': throughput
+    }
+
+def compare_with_baseline(report, baseline, threshold, min_delta):
+    # Sub-millisecond timings jitter by far more than any sane threshold, so a change
+    # also has to be at least min_delta seconds before it counts
+    regressions = []
+    print(bold(f"{'operation':<12} {'baseline':>10} {'current':>10} {'change':>8}"))
+    for operation, seconds in report['results'].items():
+        base = baseline.get('results', {}).get(operation)
+        if not base:
+            print(f"{operation:<12} {'-':>10} {seconds:>10.4f} {'new':>8}")
+            continue
+
+        change = (seconds - base) / base
+        line = f"{operation:<12} {base:>10.4f} {seconds:>10.4f} {change:>+8.1%}"
+        if abs(seconds - base) < min_delta:
+            print(line)
+        elif change > threshold:
+            regressions.append(operation)
+            print(error(line))
+        elif change < -threshold:
+            print(success(line))
+        else:
+            print(line)
+
+    return regressions
+
+def parse_bench_args(args):
+    params = dict(BENCH_DEFAULTS)
+    options = {'output': 'jit-bench.json', 'baseline': None}
+
+    i = 0
+    while i < len(args):
+        name = args[i][2:].replace('-', '_') if args[i].startswith('--') else None
+        if i + 1 >= len(args) or (name not in params and name not in options):
+            raise ValueError(f"Unknown or incomplete bench option '{args[i]}'")
+
+        value = args[i + 1]
+        if name in options:
+            options[name] = value
+        elif isinstance(BENCH_DEFAULTS[name], str):
+            params[name] = value
+        elif isinstance(BENCH_DEFAULTS[name], float):
+            params[name] = float(value)
+        else:
+            params[name] = int(value)
+        i += 2
+
+    return params, options
+
+def bench(args):
+    try:
+        params, options = parse_bench_args(args)
+    except ValueError as e:
+        print(error(f"Error: {e}"))
+        return False
+
+    if not hash_algorithm_available(params['hash']):
+        print(error(f"Error: Unknown or unavailable hash algorithm '{params['hash']}'"))
+        return False
+
+    threshold = params.pop('threshold')
+    min_delta = params.pop('min_delta')
+
+    baseline = None
+    if options['baseline']:
+        with open(options['baseline'], 'r') as f:
+            baseline = json.loads(f.read())
+        # Timings from a different synthetic repo are not comparable, so refuse before spending the time
+        mismatched = [name for name in params if baseline.get('params', {}).get(name) != params[name]]
+        if mismatched:
+            print(error(f"Error: Baseline was run with different parameters: {', '.join(mismatched)}"))
+            for name in mismatched:
+                print(f"  {name}: baseline {baseline.get('params', {}).get(name)}, current {params[name]}")
+            return False
+
+    print(info(f"Benchmarking {params['files']} files, {params['commits']} commits, {params['hash']} object IDs..."))
+    report = run_benchmarks(params)
+
+    output_path = os.path.abspath(options['output'])
+    with open(output_path, 'w') as f:
+        f.write(json.dumps(report, indent=2))
+
+    if baseline:
+        regressions = compare_with_baseline(report, baseline, threshold, min_delta)
+    else:
+        regressions = []
+        print(bold(f"{'operation':<12} {'seconds':>10}"))
+        for operation, seconds in report['results'].items():
+            print(f"{operation:<12} {seconds:>10.4f}")
+
+    print(bold(f"\n{'throughput':<14} {'GB/s':>8}"))
+    for name, gbps in report['throughput'].items():
+        print(f"{name:<14} {gbps:>8.3f}")
+
+    print(f"\nResults written to {highlight(output_path)}")
+    if regressions:
+        print(error(f"Regressions over {threshold:.0%}: {', '.join(regressions)}"))
+        return False
+    return True
+
 def main():
+    if '--profile' in sys.argv:
+        sys.argv.remove('--profile')
+        TRACE['enabled'] = True
+
+    recover_ref_journal()
+
+    if not TRACE['enabled']:
+        return run_command()
+
+    start = time.perf_counter()
+    try:
+        return run_command()
+    finally:
+        record_trace('command', start)
+        write_trace_report()
+
+def run_command():
     if len(sys.argv) < 2:
         logo = f"""
 {Fore.GREEN}     ____    _____   _____    
@@ -777,21 +2489,33 @@ def main():
         print(f"Usage: {highlight('jit')} <command> [options]")
         print(f"\n{bold('Commands:')}")
         commands = [
-            ("init", "Initialize jit repository"),
+            ("init [--hash <algorithm>]", "Initialize jit repository"),
             ("add <file_path>", "Add file to staging area"),
             ("add .", "Add all changed files to staging area"),
             ("commit -m <message>", "Commit changes with message"),
             ("log", "Show commit logs"),
             ("log --all", "Show commit logs from all branches"),
-            ("branch <name>", "Create a new branch"),
+            ("log -- <path>", "Show commits that touched a path"),
+            ("reindex", "Rebuild the path history index"),
+            ("grep [-i] <pattern> [<commit>]", "Search the working tree or a commit"),
+            ("branch <name>...", "Create one or more branches"),
             ("branches", "List all branches"),
+            ("pack-refs", "Pack branch refs into a single sorted file"),
             ("checkout <branch>", "Switch to a branch"),
             ("checkout -b <branch>", "Create and switch to a new branch"),
             ("status", "Show working tree status"),
+            ("bundle create <file> [<branch>...] [--since <commit>]", "Pack history into one file"),
+            ("bundle unbundle <file>", "Import a bundle"),
+            ("stash [push [-m <msg>]|pop|list]", "Shelve and restore local changes"),
+            ("sparse-checkout set|add|list|disable", "Only materialize matching paths"),
+            ("reflog [<branch>]", "Show where a branch tip has been"),
             ("restore <commit>", "Restore working directory to commit"),
             ("clean [-f]", "Remove untracked files"),
             ("rm <file_path>", "Remove file and stage deletion"),
             ("rebase <branch>", "Rebase current branch onto target branch"),
+            ("config <key> [<value>]", "Get or set a repository option"),
+            ("<command> --profile", "Trace hot paths and write a Chrome trace file"),
+            ("bench [--baseline <file>]", "Benchmark jit on a synthetic repository"),
         ]
 
         max_cmd_len = max(len(cmd[0]) for cmd in commands)
@@ -803,7 +2527,14 @@ def main():
     command = sys.argv[1]
 
     if command == "init":
-        init_jit()
+        if "--hash" in sys.argv:
+            position = sys.argv.index("--hash")
+            if position + 1 >= len(sys.argv):
+                print("Error: Algorithm is required after --hash")
+                return
+            init_jit(sys.argv[position + 1])
+        else:
+            init_jit()
     
     elif command == "add":
         if len(sys.argv) < 3:
@@ -833,6 +2564,11 @@ def main():
     elif command == "log":
         if len(sys.argv) >= 3 and sys.argv[2] == "--all":
             show_all_logs()
+        elif len(sys.argv) >= 3 and sys.argv[2] == "--":
+            if len(sys.argv) < 4:
+                print("Error: File path is required after --")
+                return
+            show_path_log(sys.argv[3])
         else:
             show_log()
     
@@ -844,12 +2580,66 @@ def main():
             list_branches()
             return
             
-        branch_name = sys.argv[2]
-        create_branch(branch_name)
+        create_branches(sys.argv[2:])
+    
+    elif command == "bundle":
+        if len(sys.argv) < 4 or sys.argv[2] not in ("create", "unbundle"):
+            print("Error: Usage: jit bundle create <file> [<branch>...] [--since <commit>] | jit bundle unbundle <file>")
+            return
+        
+        if sys.argv[2] == "unbundle":
+            bundle_unbundle(sys.argv[3])
+            return
+        
+        args = sys.argv[4:]
+        since = None
+        if "--since" in args:
+            position = args.index("--since")
+            if position + 1 >= len(args):
+                print("Error: Commit is required after --since")
+                return
+            since = args[position + 1]
+            args = args[:position] + args[position + 2:]
+        bundle_create(sys.argv[3], args, since)
+    
+    elif command == "stash":
+        subcommand = sys.argv[2] if len(sys.argv) >= 3 else "push"
+        if subcommand == "push":
+            message = sys.argv[4] if len(sys.argv) >= 5 and sys.argv[3] == "-m" else None
+            stash_push(message)
+        elif subcommand == "pop":
+            stash_pop()
+        elif subcommand == "list":
+            stash_list()
+        else:
+            print(f"Error: Unknown stash command '{subcommand}'")
+    
+    elif command == "sparse-checkout":
+        sparse_checkout(sys.argv[2:])
+    
+    elif command == "reflog":
+        show_reflog(sys.argv[2] if len(sys.argv) >= 3 else None)
     
     elif command == "branches":
         list_branches()
     
+    elif command == "pack-refs":
+        pack_refs()
+    
+    elif command == "reindex":
+        rebuild_path_index()
+    
+    elif command == "grep":
+        args = sys.argv[2:]
+        ignore_case = "-i" in args
+        args = [arg for arg in args if arg != "-i"]
+        if not args:
+            print("Error: Search pattern is required")
+            return
+        
+        if not grep(args[0], args[1] if len(args) >= 2 else None, ignore_case=ignore_case):
+            sys.exit(1)
+    
     elif command == "checkout":
         if len(sys.argv) < 3:
             print("Error: Branch name is required")
@@ -894,6 +2684,19 @@ def main():
                 
         target_branch = sys.argv[2]
         rebase_branch(target_branch)
+
+    elif command == "config":
+        if len(sys.argv) < 3:
+            print("Error: Config key is required")
+            return
+
+        key = sys.argv[2]
+        value = sys.argv[3] if len(sys.argv) >= 4 else None
+        set_config(key, value)
+
+    elif command == "bench":
+        if not bench(sys.argv[2:]):
+            sys.exit(1)
     
     else:
         print(f"Unknown command: {command}")
@@ -5,6 +5,10 @@ setup(
     name="jit",
     version="0.1",
     packages=find_packages(),
+    extras_require={
+        'blake3': ['blake3'],
+        'chunking': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'jit=jit.main:main',
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+JIT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jit', 'main.py')
+
+
+def jit(repo, *args):
+    return subprocess.run([sys.executable, JIT, *args], cwd=repo, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+def write(repo, path, content):
+    full_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'w') as f:
+        f.write(content)
+
+
+def test_sparse_checkout_covers_files_committed_before_head(tmp_path):
+    repo = str(tmp_path)
+    jit(repo, 'init')
+    write(repo, 'a/x.txt', 'x\n')
+    write(repo, 'b/y.txt', 'y\n')
+    jit(repo, 'add', '.')
+    jit(repo, 'commit', '-m', 'first')
+    write(repo, 'a/z.txt', 'z\n')
+    jit(repo, 'add', '.')
+    jit(repo, 'commit', '-m', 'second')
+
+    jit(repo, 'sparse-checkout', 'set', 'a')
+    assert not os.path.exists(os.path.join(repo, 'b', 'y.txt'))
+    assert os.path.exists(os.path.join(repo, 'a', 'x.txt'))
+    assert 'deleted' not in jit(repo, 'status')
+
+    jit(repo, 'sparse-checkout', 'disable')
+    with open(os.path.join(repo, 'b', 'y.txt')) as f:
+        assert f.read() == 'y\n'
+
+
+def test_add_and_rm_refuse_paths_outside_sparse_checkout(tmp_path):
+    repo = str(tmp_path)
+    jit(repo, 'init')
+    write(repo, 'a/x.txt', 'x\n')
+    write(repo, 'b/y.txt', 'y\n')
+    jit(repo, 'add', '.')
+    jit(repo, 'commit', '-m', 'first')
+
+    jit(repo, 'sparse-checkout', 'set', 'a')
+    assert 'outside the sparse checkout' in jit(repo, 'add', 'b/y.txt')
+    assert 'outside the sparse checkout' in jit(repo, 'rm', 'b/y.txt')
+    assert 'deleted' not in jit(repo, 'status')
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+JIT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jit', 'main.py')
+
+
+def jit(repo, *args):
+    return subprocess.run([sys.executable, JIT, *args], cwd=repo, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+def write(repo, path, content):
+    full_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'w') as f:
+        f.write(content)
+
+
+def read(repo, path):
+    with open(os.path.join(repo, path)) as f:
+        return f.read()
+
+
+def test_stash_covers_files_committed_before_head(tmp_path):
+    repo = str(tmp_path)
+    jit(repo, 'init')
+    write(repo, 'a.txt', 'A1\n')
+    write(repo, 'b.txt', 'B1\n')
+    jit(repo, 'add', '.')
+    jit(repo, 'commit', '-m', 'first')
+    write(repo, 'c.txt', 'C1\n')
+    jit(repo, 'add', '.')
+    jit(repo, 'commit', '-m', 'second')
+
+    write(repo, 'a.txt', 'A2\n')
+    os.remove(os.path.join(repo, 'b.txt'))
+    assert 'Saved working directory' in jit(repo, 'stash')
+    assert read(repo, 'a.txt') == 'A1\n'
+    assert read(repo, 'b.txt') == 'B1\n'
+
+    jit(repo, 'stash', 'pop')
+    assert read(repo, 'a.txt') == 'A2\n'
+    assert not os.path.exists(os.path.join(repo, 'b.txt'))